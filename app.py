@@ -1,9 +1,21 @@
 import streamlit as st
-from openai import OpenAI
+import openai
+from openai import AsyncOpenAI
+import httpx
+import aiohttp
 import os
 import io
-from pydub import AudioSegment
-from pydub.utils import make_chunks
+import asyncio
+import queue
+import threading
+import subprocess
+import tempfile
+import glob
+import hashlib
+import re
+import random
+from concurrent.futures import ThreadPoolExecutor
+from pydub.utils import mediainfo
 import math
 
 # --- Constants ---
@@ -11,33 +23,451 @@ OPENAI_API_FILE_LIMIT_MB = 25
 OPENAI_API_FILE_LIMIT_BYTES = OPENAI_API_FILE_LIMIT_MB * 1024 * 1024
 # Target slightly less for chunks to be safe with overhead
 TARGET_CHUNK_SIZE_BYTES = (OPENAI_API_FILE_LIMIT_MB - 1) * 1024 * 1024
+# Upper bound on chunk uploads in flight at once, to stay within Whisper rate limits.
+# (The Batch API can't be used to get around these limits: its JSONL requests carry no
+# file uploads and /v1/audio/transcriptions is not one of its supported endpoints.)
+MAX_CONCURRENT_REQUESTS = 5
+# In high-concurrency mode, requests skip the SDK and go straight to this endpoint over aiohttp
+WHISPER_TRANSCRIPTIONS_URL = "https://api.openai.com/v1/audio/transcriptions"
+HIGH_CONCURRENCY_MAX_REQUESTS = 20
+# HTTP connection pool for the async OpenAI client, sized well above MAX_CONCURRENT_REQUESTS so
+# concurrent uploads never queue on a free connection (httpx defaults to 10)
+HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+# Uploading and transcribing a full-size chunk can take minutes
+HTTP_TIMEOUT = httpx.Timeout(600.0, connect=30.0)
+# Transient API errors worth retrying; anything else (e.g. 400, 401) fails immediately.
+# Error statuses from the aiohttp path are classified in is_retriable().
+RETRIABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+    aiohttp.ClientConnectionError,
+    asyncio.TimeoutError,
+)
+# Longest we'll wait between retries, even if the server asks for more
+MAX_RETRY_DELAY_S = 60
+# Chunk duration used when the file's bitrate can't be determined (10 minutes)
+DEFAULT_CHUNK_LENGTH_S = 10 * 60
+# Shortest chunk we'll cut, even for very high bitrate files
+MIN_CHUNK_LENGTH_S = 60
+# Audio quieter than this for at least MIN_SILENCE_S counts as silence
+SILENCE_THRESHOLD_DB = -50
+MIN_SILENCE_S = 2.0
+# Audio kept either side of detected speech, so trimming never clips the first or last word
+SPEECH_PADDING_S = 0.5
+# Result recorded for a chunk that is over the API limit and so is never sent
+CHUNK_TOO_LARGE = object()
+# Prepared chunks waiting for an upload slot, so the producer never runs far ahead
+CHUNK_QUEUE_SIZE = 2
+# Finished transcriptions, keyed by SHA-256 of the audio that was sent, so reruns skip them
+TRANSCRIPTION_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "mp3-transcriber")
+
+
+# --- Helper Functions ---
+def is_retriable(error):
+    """True for transient errors: rate limits, timeouts, connection and server errors."""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, RETRIABLE_ERRORS)
+
+
+def retry_delay_s(error, attempt):
+    """
+    Seconds to wait before retrying after `error`: the server's Retry-After if it sent one,
+    otherwise exponential backoff with jitter. Capped at MAX_RETRY_DELAY_S either way.
+    """
+    if isinstance(error, aiohttp.ClientResponseError):
+        headers = error.headers
+    else:
+        headers = getattr(getattr(error, "response", None), "headers", None)
+    if headers is not None:
+        try:
+            return min(MAX_RETRY_DELAY_S, float(headers["retry-after"]))
+        except (KeyError, ValueError):
+            pass
+    return min(MAX_RETRY_DELAY_S, 2 ** attempt + random.random())
+
+
+async def whisper_post(session, audio_path):
+    """
+    Sends the audio file at `audio_path` straight to the Whisper endpoint, bypassing the OpenAI SDK.
+    Returns the transcript text, or raises aiohttp.ClientResponseError on an error status.
+    """
+    # A fresh handle per call: aiohttp streams it from disk and closes it once it's sent
+    with open(audio_path, "rb") as audio_file:
+        form = aiohttp.FormData()
+        form.add_field("model", "whisper-1")
+        form.add_field("response_format", "text")
+        form.add_field("file", audio_file, filename="audio_chunk.mp3", content_type="audio/mpeg")
+        async with session.post(WHISPER_TRANSCRIPTIONS_URL, data=form) as resp:
+            body = await resp.text() # Plain text, since response_format is "text"
+            if resp.status >= 400:
+                raise aiohttp.ClientResponseError(
+                    resp.request_info, resp.history, status=resp.status, message=body, headers=resp.headers
+                )
+            return body
 
 
-# --- Helper Function ---
-def transcribe_audio_chunk(client, audio_chunk_bytesio, attempt=1, max_attempts=3):
+async def sdk_transcribe(aclient, audio_file):
+    """Sends one transcription request through the OpenAI SDK for an open binary file or BytesIO."""
+    audio_file.seek(0) # Ensure pointer is at the beginning
+    # When passing a file object, OpenAI SDK needs a name.
+    # It doesn't have to be the original, just a placeholder.
+    # We also need to tell it the type.
+    # The file object is handed to the SDK as-is, so httpx streams it without an extra in-memory copy.
+    return await aclient.audio.transcriptions.create(
+        model="whisper-1",
+        file=("audio_chunk.mp3", audio_file, "audio/mpeg"), # Pass as a tuple
+        response_format="text"
+    )
+
+
+async def transcribe_audio_chunk(aclient, audio, max_attempts=3):
     """
-    Transcribes a single audio chunk (BytesIO object) using OpenAI's Whisper API.
-    Includes basic retry logic for transient errors.
+    Transcribes a single audio chunk using OpenAI's Whisper API.
+    With an AsyncOpenAI client, `audio` is a chunk file path (opened afresh for each attempt)
+    or an in-memory BytesIO. With an aiohttp session (high-concurrency mode), `audio` must be
+    a file path, which whisper_post streams from disk.
+    Rate limits, timeouts, connection and server errors are retried with backoff;
+    any other error (bad request, invalid key, ...) fails straight away.
     """
+    for attempt in range(1, max_attempts + 1):
+        try:
+            if isinstance(aclient, aiohttp.ClientSession):
+                if not isinstance(audio, (str, os.PathLike)):
+                    raise TypeError("High-concurrency mode needs the chunk's file path")
+                return await whisper_post(aclient, audio)
+            if isinstance(audio, (str, os.PathLike)):
+                with open(audio, "rb") as audio_file:
+                    return await sdk_transcribe(aclient, audio_file)
+            return await sdk_transcribe(aclient, audio)
+        except Exception as e:
+            if not is_retriable(e):
+                st.error(f"Error transcribing chunk, not retrying: {e}")
+                return None
+            st.warning(f"Error transcribing chunk (attempt {attempt}/{max_attempts}): {e}")
+            if attempt < max_attempts:
+                delay = retry_delay_s(e, attempt)
+                st.info(f"Retrying chunk transcription ({attempt+1}/{max_attempts}) in {delay:.0f}s...")
+                await asyncio.sleep(delay)
+
+    st.error(f"Failed to transcribe chunk after {max_attempts} attempts.")
+    return None
+
+
+def file_sha256(path, block_size=1024 * 1024):
+    """Returns the hex SHA-256 of a file's contents, reading it in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_cached_transcription(key):
+    """Returns the cached transcription for `key`, or None if there isn't one."""
     try:
-        audio_chunk_bytesio.seek(0) # Ensure pointer is at the beginning
-        # When passing a file object, OpenAI SDK needs a name.
-        # It doesn't have to be the original, just a placeholder.
-        # We also need to tell it the type.
-        transcript = client.audio.transcriptions.create(
-            model="whisper-1",
-            file=("audio_chunk.mp3", audio_chunk_bytesio, "audio/mpeg"), # Pass as a tuple
-            response_format="text"
+        with open(os.path.join(TRANSCRIPTION_CACHE_DIR, f"{key}.txt"), encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def save_cached_transcription(key, text):
+    """Stores a transcription in the disk cache. The cache is best-effort, so write errors are ignored."""
+    try:
+        os.makedirs(TRANSCRIPTION_CACHE_DIR, exist_ok=True)
+        # Write then rename, so an interrupted run never leaves a truncated entry behind
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=TRANSCRIPTION_CACHE_DIR, suffix=".tmp", delete=False) as f:
+            f.write(text)
+        os.replace(f.name, os.path.join(TRANSCRIPTION_CACHE_DIR, f"{key}.txt"))
+    except OSError:
+        pass
+
+
+def make_async_client(api_key, high_concurrency=False):
+    """
+    Builds an AsyncOpenAI client on a pooled httpx.AsyncClient or, in high-concurrency mode,
+    an aiohttp session for whisper_post (httpx's async pool falls behind at high concurrency).
+    Must be called inside the running event loop, since the pool is bound to it.
+    """
+    if high_concurrency:
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=HTTP_LIMITS.max_connections),
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT.read, connect=HTTP_TIMEOUT.connect),
+            headers={"Authorization": f"Bearer {api_key}"},
         )
-        return transcript
+    return AsyncOpenAI(
+        api_key=api_key,
+        max_retries=0, # Retries are handled (with backoff) by transcribe_audio_chunk
+        http_client=httpx.AsyncClient(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT),
+    )
+
+
+async def transcribe_single(api_key, audio_file, key):
+    """
+    Transcribes one file with a short-lived async client, or returns the cached
+    transcription stored under `key` (the file's SHA-256) by an earlier run.
+    """
+    transcription_text = load_cached_transcription(key)
+    if transcription_text is not None:
+        return transcription_text
+    async with make_async_client(api_key) as aclient:
+        transcription_text = await transcribe_audio_chunk(aclient, audio_file)
+    if transcription_text:
+        save_cached_transcription(key, transcription_text)
+    return transcription_text
+
+
+def estimate_chunk_length_s(input_path, file_size_bytes):
+    """
+    Picks a chunk duration that keeps chunks under TARGET_CHUNK_SIZE_BYTES at the file's
+    average bitrate, with 5% headroom for VBR, and no shorter than MIN_CHUNK_LENGTH_S.
+    """
+    try:
+        # ffprobe reads the duration from the headers, no decoding needed
+        duration_s = float(mediainfo(input_path)["duration"])
+    except (KeyError, ValueError, OSError):
+        return DEFAULT_CHUNK_LENGTH_S
+    if duration_s <= 0:
+        return DEFAULT_CHUNK_LENGTH_S
+
+    bitrate_bps = file_size_bytes * 8 / duration_s
+    return max(MIN_CHUNK_LENGTH_S, int(TARGET_CHUNK_SIZE_BYTES * 8 / bitrate_bps * 0.95))
+
+
+def split_mp3_stream_copy(input_path, output_dir, segment_seconds):
+    """
+    Splits an MP3 into ~`segment_seconds` pieces with ffmpeg's segment muxer.
+    The audio is stream-copied (cut on MP3 frame boundaries), so nothing is decoded or re-encoded.
+    Returns the segment file paths in order.
+    """
+    subprocess.run(
+        [
+            "ffmpeg", "-hide_banner", "-loglevel", "error", "-i", input_path,
+            "-map", "0:a", # Drop embedded cover art, which the segment muxer can't copy
+            "-f", "segment", "-segment_time", str(segment_seconds),
+            "-c", "copy", "-reset_timestamps", "1",
+            os.path.join(output_dir, "c%03d.mp3"),
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return sorted(glob.glob(os.path.join(output_dir, "c*.mp3")))
+
+
+def resplit_oversized_segments(segment_paths, segment_seconds):
+    """
+    Cuts every segment over OPENAI_API_FILE_LIMIT_BYTES into shorter stream-copied pieces,
+    in parallel, and returns the full list of chunk paths in order. Like the first split,
+    this never decodes the audio, so memory use stays flat however long the file is.
+    """
+    def resplit(path):
+        size = os.path.getsize(path)
+        if size <= OPENAI_API_FILE_LIMIT_BYTES:
+            return [path]
+        pieces = math.ceil(size / TARGET_CHUNK_SIZE_BYTES)
+        parts_dir = os.path.splitext(path)[0] + "_parts"
+        os.makedirs(parts_dir)
+        return split_mp3_stream_copy(path, parts_dir, max(1, int(segment_seconds / pieces * 0.95)))
+
+    # Each split is an ffmpeg subprocess, so threads are enough to use every core
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+        return [part for parts in executor.map(resplit, segment_paths) for part in parts]
+
+
+def detect_speech_bounds(path):
+    """
+    Runs ffmpeg's silencedetect filter over a chunk and returns (start_s, end_s) of the audio
+    between its leading and trailing silence, or None if the chunk is silent throughout.
+    end_s is None when the chunk doesn't end in silence.
+    """
+    result = subprocess.run(
+        [
+            "ffmpeg", "-hide_banner", "-nostats", "-i", path,
+            "-af", f"silencedetect=noise={SILENCE_THRESHOLD_DB}dB:d={MIN_SILENCE_S}",
+            "-f", "null", "-",
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    match = re.search(r"Duration: (\d+):(\d+):([\d.]+)", result.stderr)
+    duration_s = int(match[1]) * 3600 + int(match[2]) * 60 + float(match[3]) if match else math.inf
+
+    # Silent intervals as [start, end]; the end is missing if the silence runs to the end of the file
+    silences = []
+    for kind, value in re.findall(r"silence_(start|end): (-?[\d.]+)", result.stderr):
+        if kind == "start":
+            silences.append([float(value), None])
+        elif silences:
+            silences[-1][1] = float(value)
+
+    start_s, end_s = 0.0, duration_s
+    if silences and silences[0][0] <= 0.05:
+        start_s = silences[0][1] if silences[0][1] is not None else duration_s
+    if silences and (silences[-1][1] is None or silences[-1][1] >= duration_s - 0.05):
+        end_s = silences[-1][0]
+    if start_s >= end_s:
+        return None
+    return max(0.0, start_s - SPEECH_PADDING_S), (end_s + SPEECH_PADDING_S if end_s < duration_s else None)
+
+
+def skip_silence(chunk_iter):
+    """
+    Yields (i, path) with leading/trailing silence stream-copied out of each chunk,
+    or (i, None) for chunks with no sound at all, so they're never uploaded.
+    Detection is best-effort: if ffmpeg fails on a chunk, it is passed through unchanged.
+    """
+    for i, path in chunk_iter:
+        try:
+            bounds = detect_speech_bounds(path)
+        except (OSError, subprocess.CalledProcessError):
+            yield i, path
+            continue
+        if bounds is None:
+            yield i, None
+            continue
+
+        start_s, end_s = bounds
+        if start_s <= 0 and end_s is None:
+            yield i, path # Nothing to trim
+            continue
+        trimmed_path = os.path.splitext(path)[0] + "_speech.mp3"
+        try:
+            subprocess.run(
+                [
+                    "ffmpeg", "-hide_banner", "-loglevel", "error", "-i", path,
+                    "-ss", f"{start_s:.3f}", *(["-to", f"{end_s:.3f}"] if end_s is not None else []),
+                    "-map", "0:a", "-c", "copy", trimmed_path,
+                ],
+                check=True,
+                capture_output=True,
+            )
+        except (OSError, subprocess.CalledProcessError):
+            yield i, path
+            continue
+        yield i, trimmed_path
+
+
+def produce_chunks(chunk_iter, chunk_queue, stop_event):
+    """
+    Producer thread: drains `chunk_iter` and hands each (i, path) chunk to the uploader
+    (a None path marks a silent chunk that needs no upload).
+    Puts None on the queue when done, or the exception instead if preparing a chunk fails.
+    Returns early, without preparing further chunks, once `stop_event` is set.
+    """
+    def put(item):
+        # Time out regularly so an abandoned run can't leave this thread blocked on a full queue
+        while not stop_event.is_set():
+            try:
+                chunk_queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    try:
+        for item in chunk_iter:
+            if not put(item):
+                return
+        put(None)
     except Exception as e:
-        st.warning(f"Error transcribing chunk (attempt {attempt}/{max_attempts}): {e}")
-        if attempt < max_attempts:
-            st.info(f"Retrying chunk transcription ({attempt+1}/{max_attempts})...")
-            return transcribe_audio_chunk(client, audio_chunk_bytesio, attempt + 1, max_attempts)
-        else:
-            st.error(f"Failed to transcribe chunk after {max_attempts} attempts.")
-            return None
+        put(e)
+
+
+async def transcribe_chunks_concurrently(api_key, chunk_queue, num_chunks, on_chunk_done, max_concurrency=MAX_CONCURRENT_REQUESTS, high_concurrency=False):
+    """
+    Pulls chunk files off `chunk_queue` and transcribes them concurrently, with at most
+    `max_concurrency` requests in flight, while the producer thread keeps exporting.
+    Results are returned in chunk order; `on_chunk_done(i, text, completed)` is called as each
+    chunk finishes, with `completed` being the number of chunks finished so far. A result is
+    the transcript, "" for a silent chunk, None if transcription failed, or CHUNK_TOO_LARGE.
+    `high_concurrency` sends requests over aiohttp instead of the SDK (see make_async_client).
+    """
+    transcriptions_list = [None] * num_chunks
+    sem = asyncio.Semaphore(max_concurrency)
+    completed = 0
+    export_error = None
+
+    # The async client is created inside the running event loop so its
+    # connection pool is bound to (and closed with) this loop.
+    async with make_async_client(api_key, high_concurrency) as aclient:
+        def finish(i, chunk_transcription):
+            nonlocal completed
+            transcriptions_list[i] = chunk_transcription
+            completed += 1
+            on_chunk_done(i, chunk_transcription, completed)
+
+        async def upload(i, chunk_path):
+            chunk_transcription = None
+            try:
+                # Chunks that succeeded on an earlier run are served from the disk cache
+                key = await asyncio.to_thread(file_sha256, chunk_path)
+                chunk_transcription = load_cached_transcription(key)
+                if chunk_transcription is None:
+                    chunk_transcription = await transcribe_audio_chunk(aclient, chunk_path)
+                    if chunk_transcription:
+                        save_cached_transcription(key, chunk_transcription)
+            except Exception as e:
+                # A bad chunk (e.g. an unreadable file) is marked failed; the other chunks carry on
+                st.error(f"Error transcribing chunk {i+1}: {e}")
+                chunk_transcription = None
+            finally:
+                sem.release()
+            finish(i, chunk_transcription)
+
+        tasks = []
+
+        async def next_item():
+            # Poll rather than block on get(), so an upload that raised (e.g. Streamlit
+            # interrupting the script for a rerun) ends the run instead of waiting on the producer
+            while True:
+                for task in tasks:
+                    if task.done() and not task.cancelled() and task.exception() is not None:
+                        raise task.exception()
+                try:
+                    return await asyncio.to_thread(chunk_queue.get, timeout=0.5)
+                except queue.Empty:
+                    pass
+
+        while True:
+            # Take an upload slot before pulling the next chunk, so that while all slots
+            # are busy the producer blocks on the bounded queue instead of piling up chunks.
+            await sem.acquire()
+            try:
+                item = await next_item()
+            except BaseException:
+                sem.release()
+                raise
+            if item is None or isinstance(item, Exception):
+                sem.release()
+                export_error = item
+                break
+
+            i, chunk_path = item
+            if chunk_path is None:
+                finish(i, "") # Silent chunk, nothing to transcribe
+                sem.release()
+                continue
+
+            chunk_size = os.path.getsize(chunk_path)
+            if chunk_size > OPENAI_API_FILE_LIMIT_BYTES:
+                st.error(f"Chunk {i+1} is still over the {OPENAI_API_FILE_LIMIT_MB}MB limit ({chunk_size / (1024*1024):.2f}MB) after re-splitting. "
+                         f"Try a smaller file or re-encode it at a lower bitrate.")
+                finish(i, CHUNK_TOO_LARGE)
+                sem.release()
+                continue # Skip this chunk
+
+            tasks.append(asyncio.create_task(upload(i, chunk_path)))
+
+        await asyncio.gather(*tasks)
+
+    if export_error is not None:
+        raise export_error
+    return transcriptions_list
 
 
 # --- Streamlit App ---
@@ -52,57 +482,62 @@ This app uses a pre-configured API key.
 
 # --- API Key Handling (Secrets Only - Robust) ---
 # (Using the robust version from our previous iteration)
-openai_api_key = None
-api_key_found = False
-error_message_for_user = "Initial check."
-
-openai_section = st.secrets.get("openai")
-if openai_section is not None and hasattr(openai_section, "get"):
-    potential_key = openai_section.get("api_key")
-    if potential_key is not None:
-        if isinstance(potential_key, str):
-            cleaned_key = potential_key.strip()
-            if cleaned_key.startswith("sk-"):
-                openai_api_key = cleaned_key
-                api_key_found = True
-                error_message_for_user = "API key from [openai] section loaded successfully."
+# Streamlit reruns the whole script on every interaction, so parse and validate the key
+# from secrets once. (API clients are built per transcription, inside its event loop.)
+# The st.stop() branches raise, and a raised call isn't cached, so a misconfigured key
+# keeps being reported until it's fixed.
+@st.cache_resource(show_spinner=False)
+def get_openai_api_key():
+    openai_api_key = None
+    api_key_found = False
+    error_message_for_user = "Initial check."
+
+    openai_section = st.secrets.get("openai")
+    if openai_section is not None and hasattr(openai_section, "get"):
+        potential_key = openai_section.get("api_key")
+        if potential_key is not None:
+            if isinstance(potential_key, str):
+                cleaned_key = potential_key.strip()
+                if cleaned_key.startswith("sk-"):
+                    openai_api_key = cleaned_key
+                    api_key_found = True
+                    error_message_for_user = "API key from [openai] section loaded successfully."
+                else:
+                    error_message_for_user = f"The 'api_key' (value: '{cleaned_key}') under '[openai]' in secrets was found but does not start with 'sk-'."
             else:
-                error_message_for_user = f"The 'api_key' (value: '{cleaned_key}') under '[openai]' in secrets was found but does not start with 'sk-'."
+                error_message_for_user = f"The 'api_key' under '[openai]' in secrets is not a string. Found type: {type(potential_key)}."
         else:
-            error_message_for_user = f"The 'api_key' under '[openai]' in secrets is not a string. Found type: {type(potential_key)}."
+            error_message_for_user = "The '[openai]' section was found in secrets, but the 'api_key' key is missing or has no value within it."
     else:
-        error_message_for_user = "The '[openai]' section was found in secrets, but the 'api_key' key is missing or has no value within it."
-else:
-    error_message_for_user = "The '[openai]' section was not found in secrets or is not structured as expected."
-    if "OPENAI_API_KEY" in st.secrets: # Fallback for flat key
-        error_message_for_user += " Trying flat 'OPENAI_API_KEY'..."
-        potential_flat_key = st.secrets.get("OPENAI_API_KEY")
-        if potential_flat_key is not None and isinstance(potential_flat_key, str):
-            cleaned_flat_key = potential_flat_key.strip()
-            if cleaned_flat_key.startswith("sk-"):
-                openai_api_key = cleaned_flat_key
-                api_key_found = True
-                error_message_for_user = "API key loaded successfully from flat 'OPENAI_API_KEY'."
+        error_message_for_user = "The '[openai]' section was not found in secrets or is not structured as expected."
+        if "OPENAI_API_KEY" in st.secrets: # Fallback for flat key
+            error_message_for_user += " Trying flat 'OPENAI_API_KEY'..."
+            potential_flat_key = st.secrets.get("OPENAI_API_KEY")
+            if potential_flat_key is not None and isinstance(potential_flat_key, str):
+                cleaned_flat_key = potential_flat_key.strip()
+                if cleaned_flat_key.startswith("sk-"):
+                    openai_api_key = cleaned_flat_key
+                    api_key_found = True
+                    error_message_for_user = "API key loaded successfully from flat 'OPENAI_API_KEY'."
+                else:
+                    error_message_for_user = f"Flat 'OPENAI_API_KEY' (value: '{cleaned_flat_key}') was found but does not start with 'sk-'."
+            elif potential_flat_key is not None:
+                 error_message_for_user = f"Flat 'OPENAI_API_KEY' was found but is not a string. Found type: {type(potential_flat_key)}."
             else:
-                error_message_for_user = f"Flat 'OPENAI_API_KEY' (value: '{cleaned_flat_key}') was found but does not start with 'sk-'."
-        elif potential_flat_key is not None:
-             error_message_for_user = f"Flat 'OPENAI_API_KEY' was found but is not a string. Found type: {type(potential_flat_key)}."
-        else:
-            error_message_for_user = "Flat 'OPENAI_API_KEY' was found but has no value."
-
-if not api_key_found:
-    st.error("OpenAI API Key not found or incorrectly configured in Streamlit Secrets.")
-    st.warning(f"""
-        **Troubleshooting Detail:** {error_message_for_user}
-        Please ensure your OpenAI API Key is configured correctly in your Streamlit Cloud app's Secrets.
-    """)
-    st.stop()
-
-try:
-    client = OpenAI(api_key=openai_api_key)
-except Exception as e:
-    st.error(f"Failed to initialize OpenAI client: {e}")
-    st.stop()
+                error_message_for_user = "Flat 'OPENAI_API_KEY' was found but has no value."
+
+    if not api_key_found:
+        st.error("OpenAI API Key not found or incorrectly configured in Streamlit Secrets.")
+        st.warning(f"""
+            **Troubleshooting Detail:** {error_message_for_user}
+            Please ensure your OpenAI API Key is configured correctly in your Streamlit Cloud app's Secrets.
+        """)
+        st.stop()
+
+    return openai_api_key
+
+
+openai_api_key = get_openai_api_key()
 
 st.divider()
 
@@ -125,16 +560,30 @@ if uploaded_file is not None:
         st.warning(f"Could not display audio player (file might be too large for direct browser playback): {e}")
 
 
+    skip_silence_enabled = st.checkbox(
+        "Skip silent passages",
+        value=True,
+        help="For files that need chunking: trims silence from the start and end of each chunk, and skips chunks with no sound at all, so they aren't sent (or billed) for transcription."
+    )
+
+    high_concurrency_enabled = st.checkbox(
+        "High-concurrency mode",
+        value=False,
+        help=f"For files that need chunking: sends up to {HIGH_CONCURRENCY_MAX_REQUESTS} chunks at once (instead of {MAX_CONCURRENT_REQUESTS}) over a direct HTTP connection. Faster for long files, but needs an OpenAI account with higher rate limits."
+    )
+
     if st.button("Transcribe Audio", type="primary"):
         with st.spinner("Processing audio... Please wait. This may take a while for large files."):
             full_transcription = ""
-            uploaded_file.seek(0) # Reset file pointer
+            # Read the upload once; the size check, hashing, upload and chunking all reuse these bytes
+            data = uploaded_file.getvalue()
 
-            if uploaded_file.size <= OPENAI_API_FILE_LIMIT_BYTES:
+            if len(data) <= OPENAI_API_FILE_LIMIT_BYTES:
                 st.info("File is within size limit, transcribing directly...")
-                # Pass the file object directly. OpenAI SDK needs a name.
-                # The SDK will handle reading it.
-                transcription_text = transcribe_audio_chunk(client, uploaded_file)
+                # Keyed by content, so transcribing the same file again doesn't re-upload (or re-bill) it
+                file_hash = hashlib.sha256(data).hexdigest()
+                # BytesIO shares the bytes' buffer rather than copying it, and gives the retry loop something to seek
+                transcription_text = asyncio.run(transcribe_single(openai_api_key, io.BytesIO(data), file_hash))
                 if transcription_text:
                     full_transcription = transcription_text
                 else:
@@ -142,62 +591,91 @@ if uploaded_file is not None:
             else:
                 st.info(f"File size ({file_size_mb:.2f} MB) exceeds {OPENAI_API_FILE_LIMIT_MB}MB limit. Splitting into chunks...")
                 
-                try:
-                    uploaded_file.seek(0) # Ensure pointer is at the start
-                    audio = AudioSegment.from_file(uploaded_file, format="mp3")
-                    st.success("Audio loaded for chunking.")
-                except Exception as e:
-                    st.error(f"Error loading audio file with pydub: {e}")
-                    st.error("This might be due to an issue with ffmpeg or the file format. Ensure ffmpeg is in packages.txt and the MP3 is valid.")
-                    st.stop()
-
-                # Estimate chunk duration to be under TARGET_CHUNK_SIZE_BYTES
-                # This is a rough estimate as bitrate can vary.
-                # Duration in ms = (target_bytes * 8 bits/byte) / (bitrate_kbps * 1000 bits/kbps) * 1000 ms/s
-                # A simpler way is to just pick a reasonable duration like 10-15 minutes.
-                # Let's try chunking by a fixed duration that's likely to be under the size limit.
-                # e.g., 10 minutes = 10 * 60 * 1000 ms
-                # Or, more dynamically, try to estimate based on file size and duration
-                
-                # More robust: calculate number of chunks needed
-                # For very high bitrate audio, this might still create chunks > 25MB
-                # A safer approach might be to target smaller time chunks (e.g., 5-10 mins)
-                # and then if an exported chunk is > 25MB, re-chunk that smaller piece.
-                # For now, let's use make_chunks with a reasonable time.
-                # 10 minutes chunk length
-                chunk_length_ms = 10 * 60 * 1000
-                audio_chunks = make_chunks(audio, chunk_length_ms)
-                num_chunks = len(audio_chunks)
-
-                st.info(f"Splitting into {num_chunks} chunks (approx. {chunk_length_ms/60000:.0f} min each).")
-                
-                transcriptions_list = []
-                chunk_progress = st.progress(0)
-
-                for i, chunk in enumerate(audio_chunks):
-                    st.text(f"Processing chunk {i+1} of {num_chunks}...")
-                    
-                    # Export chunk to an in-memory bytes object
-                    chunk_io = io.BytesIO()
-                    chunk.export(chunk_io, format="mp3")
-                    chunk_io.seek(0) # Reset pointer
-
-                    if chunk_io.getbuffer().nbytes > OPENAI_API_FILE_LIMIT_BYTES:
-                        st.error(f"Chunk {i+1} is too large ({chunk_io.getbuffer().nbytes / (1024*1024):.2f}MB) even after splitting by time. "
-                                 f"This can happen with very high bitrate audio. Try a smaller file or re-encode.")
-                        # Optionally, implement sub-chunking here if desired
-                        transcriptions_list.append(f"[ERROR: CHUNK {i+1} TOO LARGE TO PROCESS]")
-                        continue # Skip this chunk
-
-                    chunk_transcription = transcribe_audio_chunk(client, chunk_io)
-                    if chunk_transcription:
-                        transcriptions_list.append(chunk_transcription)
-                        st.text(f"Chunk {i+1} transcribed.")
-                    else:
-                        transcriptions_list.append(f"[ERROR: CHUNK {i+1} FAILED TRANSCRIPTION]")
-                        st.warning(f"Transcription for chunk {i+1} failed.")
-                    
-                    chunk_progress.progress((i + 1) / num_chunks)
+                with tempfile.TemporaryDirectory() as tmpdir:
+                    input_path = os.path.join(tmpdir, "input.mp3")
+                    with open(input_path, "wb") as f:
+                        f.write(data)
+
+                    # Size chunks from the actual bitrate rather than a fixed duration
+                    chunk_length_s = estimate_chunk_length_s(input_path, len(data))
+
+                    # Cut the MP3 on frame boundaries without decoding it
+                    try:
+                        segment_paths = split_mp3_stream_copy(input_path, tmpdir, chunk_length_s)
+                        if any(os.path.getsize(path) > OPENAI_API_FILE_LIMIT_BYTES for path in segment_paths):
+                            # Variable bitrate audio can run over the limit in dense passages
+                            st.info("Some chunks exceed the size limit, cutting those into shorter pieces...")
+                            segment_paths = resplit_oversized_segments(segment_paths, chunk_length_s)
+                    except (OSError, subprocess.CalledProcessError) as e:
+                        st.error(f"Error splitting audio file with ffmpeg: {getattr(e, 'stderr', None) or e}")
+                        st.error("This might be due to an issue with ffmpeg or the file format. Ensure ffmpeg is in packages.txt and the MP3 is valid.")
+                        st.stop()
+
+                    chunk_iter = enumerate(segment_paths)
+                    if skip_silence_enabled:
+                        chunk_iter = skip_silence(chunk_iter)
+                    num_chunks = len(segment_paths)
+
+                    st.info(f"Splitting into {num_chunks} chunks (up to ~{chunk_length_s/60:.0f} min each).")
+
+                    # Prepare chunks on a background thread while earlier chunks are uploading
+                    chunk_queue = queue.Queue(maxsize=CHUNK_QUEUE_SIZE)
+                    stop_producer = threading.Event()
+                    producer = threading.Thread(target=produce_chunks, args=(chunk_iter, chunk_queue, stop_producer), daemon=True)
+                    producer.start()
+
+                    chunk_progress = st.progress(0)
+                    # Text so far, shown as chunks finish so the user can start reading mid-run
+                    live_placeholder = st.empty()
+                    rendered = [""] * num_chunks
+
+                    def on_chunk_done(i, chunk_transcription, completed):
+                        rendered[i] = chunk_transcription if isinstance(chunk_transcription, str) else ""
+                        live_placeholder.text_area(
+                            "Transcription (live)",
+                            " ".join(filter(None, rendered)),
+                            height=300,
+                            disabled=True, # Editing it would trigger a rerun and abort the in-flight uploads
+                            key=f"live_transcription_{completed}", # Text may repeat (e.g. after a silent chunk)
+                        )
+                        if chunk_transcription is None:
+                            st.warning(f"Transcription for chunk {i+1} failed.")
+                        elif chunk_transcription is CHUNK_TOO_LARGE:
+                            st.warning(f"Chunk {i+1} skipped, too large to transcribe.")
+                        elif chunk_transcription:
+                            st.text(f"Chunk {i+1} transcribed.")
+                        else:
+                            st.text(f"Chunk {i+1} has no speech, skipped.")
+                        chunk_progress.progress(completed / num_chunks)
+
+                    try:
+                        transcriptions_list = asyncio.run(
+                            transcribe_chunks_concurrently(
+                                openai_api_key, chunk_queue, num_chunks, on_chunk_done,
+                                max_concurrency=HIGH_CONCURRENCY_MAX_REQUESTS if high_concurrency_enabled else MAX_CONCURRENT_REQUESTS,
+                                high_concurrency=high_concurrency_enabled,
+                            )
+                        )
+                    except Exception as e:
+                        st.error(f"Error preparing audio chunk: {e}")
+                        st.stop()
+                    finally:
+                        # Also runs when the run is aborted (an error, or a rerun from a widget change):
+                        # stop the producer and wait for it before the temp directory is deleted
+                        stop_producer.set()
+                        while producer.is_alive():
+                            try:
+                                chunk_queue.get_nowait()
+                            except queue.Empty:
+                                pass
+                            producer.join(timeout=0.1)
+                    live_placeholder.empty() # Replaced by the full result below
+
+                    for i, chunk_transcription in enumerate(transcriptions_list):
+                        if chunk_transcription is None:
+                            transcriptions_list[i] = f"[ERROR: CHUNK {i+1} FAILED TRANSCRIPTION]"
+                        elif chunk_transcription is CHUNK_TOO_LARGE:
+                            transcriptions_list[i] = f"[ERROR: CHUNK {i+1} TOO LARGE TO PROCESS]"
 
                 full_transcription = " ".join(filter(None, transcriptions_list))
                 chunk_progress.empty() # Remove progress bar